@@ -1,13 +1,39 @@
 import argparse
+import io
 import os
 import platform
 import subprocess
+import tempfile
 import logging
-from fpdf import FPDF
-from docx import Document
+import logging.handlers
+import multiprocessing
+import shlex
+import signal
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from contextlib import contextmanager
+import pymupdf
+from lxml import etree
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
 from datetime import datetime
 import sys
 
+MAX_WORKERS = 8
+TEXT_CHUNK_SIZE = 65536
+_SYSTEM = platform.system()
+_SCRIPT_PATH = os.path.abspath(__file__)
+_SCRIPT_DIR = os.path.dirname(_SCRIPT_PATH)
+# os.umask can only be read by setting it, so restore it straight away.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+_PAGE_RECT = pymupdf.paper_rect("a4")
+_TEXT_RECT = _PAGE_RECT + (36, 36, -36, -36)
+_PDF_CSS = "* {font-family: sans-serif; font-size: 12pt; white-space: pre-wrap; overflow-wrap: break-word;}"
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
 def setup_logging(log_file):
     logging.basicConfig(filename=log_file, level=logging.INFO,
                         format='%(asctime)s - %(levelname)s - %(message)s')
@@ -24,97 +50,323 @@ def parse_arguments():
     parser.add_argument("--dir", required=True, help="Directory containing files to convert")
     parser.add_argument("--ext", required=True, help="File extension to look for (e.g., .txt, .docx)")
     parser.add_argument("--format", required=True, help="Target conversion format (e.g., .pdf)")
-    parser.add_argument("--frequency", type=int, required=True, help="Frequency of the task")
-    parser.add_argument("--unit", choices=["minute", "hour", "day"], required=True, help="Unit of time")
+    parser.add_argument("--frequency", type=int, help="Frequency of the task")
+    parser.add_argument("--unit", choices=["minute", "hour", "day"], help="Unit of time")
     parser.add_argument("--scheduled", action='store_true', help="Indicates if the script is running as a scheduled task")
-    return parser.parse_args()
+    parser.add_argument("--watch", action='store_true', help="Watch the directory and convert files as they change instead of scheduling a task")
+    args = parser.parse_args()
+    if not (args.scheduled or args.watch) and (args.frequency is None or args.unit is None):
+        parser.error("--frequency and --unit are required unless --scheduled or --watch is given")
+    if not args.format.startswith("."):
+        args.format = "." + args.format
+    return args
 
 def check_files(directory, extension):
-    files = [f for f in os.listdir(directory) if f.endswith(extension)]
-    if not files:
+    if not extension:
+        logging.warning("No file extension given, skipping scan.")
+        return
+    found = False
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False) and entry.name.endswith(extension):
+                    found = True
+                    yield entry
+    except OSError as e:
+        logging.error(f"Cannot scan {directory}: {e}")
+        return
+    if not found:
         logging.info(f"No files with extension {extension} found in {directory}")
-    return files
 
-def txt_to_pdf(txt_file, pdf_file):
+def _new_story():
+    return pymupdf.Story(user_css=_PDF_CSS)
+
+def _write_pdf(story, pdf_file, src_mtime=None):
+    # MuPDF lays the story out natively; keep adding pages until it all fits.
+    buffer = io.BytesIO()
+    writer = pymupdf.DocumentWriter(buffer, "compress")
+    more = True
+    while more:
+        device = writer.begin_page(_PAGE_RECT)
+        more, _ = story.place(_TEXT_RECT)
+        story.draw(device)
+        writer.end_page()
+    writer.close()
+    # Write to a uniquely named file beside the target and swap it in, so a
+    # crash or a concurrent conversion never leaves a partial PDF that the
+    # mtime check would take as up to date.
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(pdf_file) or ".", suffix=".tmp")
     try:
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        pdf.set_font("Arial", size=12)
+        with os.fdopen(fd, "wb") as out:
+            out.write(buffer.getbuffer())
+            out.flush()
+            os.fsync(out.fileno())
+        # mkstemp creates the file 0600; give the PDF what open() would.
+        os.chmod(tmp_file, 0o666 & ~_UMASK)
+        os.replace(tmp_file, pdf_file)
+        if src_mtime is not None:
+            # Stamp the output with the source mtime read before conversion, so
+            # an edit made while converting still reads as stale.
+            os.utime(pdf_file, ns=(src_mtime, src_mtime))
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+def txt_to_pdf(txt_file, pdf_file, src_mtime=None):
+    try:
+        story = _new_story()
         with open(txt_file, 'r', encoding='utf-8') as file:
-            for line in file:
-                pdf.multi_cell(0, 10, line)
-        pdf.output(pdf_file)
+            while lines := file.readlines(TEXT_CHUNK_SIZE):
+                story.body.add_division().add_text(''.join(lines))
+        _write_pdf(story, pdf_file, src_mtime)
         logging.info(f"Converted {txt_file} → {pdf_file}")
     except Exception as e:
         logging.error(f"Error converting {txt_file} to PDF: {e}")
 
-def docx_to_pdf(docx_file, pdf_file):
+def read_docx_text(docx_file):
+    # Stream word/document.xml directly rather than building python-docx
+    # Paragraph objects; only the text of each <w:p> is needed.
+    paragraphs = []
+    with zipfile.ZipFile(docx_file) as archive, archive.open("word/document.xml") as xml:
+        for _, para in etree.iterparse(xml, tag=f"{_W}p"):
+            parts = []
+            for node in para.iter(f"{_W}t", f"{_W}tab", f"{_W}br", f"{_W}cr"):
+                if node.tag == f"{_W}t":
+                    parts.append(node.text or "")
+                elif node.tag == f"{_W}tab":
+                    parts.append("\t")
+                else:
+                    parts.append("\n")
+            paragraphs.append("".join(parts))
+            para.clear()
+    return "\n".join(paragraphs)
+
+def docx_to_pdf(docx_file, pdf_file, src_mtime=None):
     try:
-        doc = Document(docx_file)
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        pdf.set_font("Arial", size=12)
-        for para in doc.paragraphs:
-            pdf.multi_cell(0, 10, para.text)
-        pdf.output(pdf_file)
+        story = _new_story()
+        story.body.add_text(read_docx_text(docx_file))
+        _write_pdf(story, pdf_file, src_mtime)
         logging.info(f"Converted {docx_file} → {pdf_file}")
     except Exception as e:
         logging.error(f"Error converting {docx_file} to PDF: {e}")
 
-def convert_file(file_path, target_format):
+_CONVERTERS = {
+    (".txt", ".pdf"): txt_to_pdf,
+    (".docx", ".pdf"): docx_to_pdf,
+}
+
+def is_up_to_date(file_path, out_path, src_mtime=None):
+    # Outputs carry their source's mtime (see _write_pdf); anything else is stale.
+    try:
+        if src_mtime is None:
+            src_mtime = os.stat(file_path).st_mtime_ns
+        return os.stat(out_path).st_mtime_ns == src_mtime
+    except FileNotFoundError:
+        return False
+
+def convert_file(file_path, target_format, src_mtime=None):
     base, ext = os.path.splitext(file_path)
-    conversions = {
-        (".txt", ".pdf"): txt_to_pdf,
-        (".docx", ".pdf"): docx_to_pdf,
-    }
-    if (ext, target_format) in conversions:
-        conversions[(ext, target_format)](file_path, base + target_format)
+    converter = _CONVERTERS.get((ext, target_format))
+    if converter:
+        out_path = base + target_format
+        if src_mtime is None:
+            try:
+                src_mtime = os.stat(file_path).st_mtime_ns
+            except FileNotFoundError:
+                logging.warning(f"Skipping {file_path}, it no longer exists")
+                return
+        if is_up_to_date(file_path, out_path, src_mtime):
+            logging.info(f"Skipping {file_path}, {out_path} is up to date")
+            return
+        converter(file_path, out_path, src_mtime)
     else:
         logging.warning(f"Conversion from {ext} to {target_format} is not supported.")
 
+def _init_worker(log_queue):
+    # Forked workers inherit the parent's FileHandler; replace it so every
+    # record goes through the parent's single listener instead.
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+    # Let the parent handle Ctrl+C and shut the pool down cleanly.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+@contextmanager
+def conversion_pool(workers):
+    log_queue = multiprocessing.Queue(-1)
+    listener = logging.handlers.QueueListener(log_queue, *logging.getLogger().handlers)
+    listener.start()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(log_queue,)) as executor:
+            yield executor
+    finally:
+        listener.stop()
+
+def _log_failure(future):
+    if future.exception():
+        logging.error(f"Conversion failed: {future.exception()}")
+
+def convert_files(directory, extension, target_format):
+    workers = min(os.cpu_count() or 1, MAX_WORKERS)
+    pending = deque()
+    with conversion_pool(workers) as executor:
+        # Submit while scanning so conversion overlaps enumeration; bound the
+        # number of in-flight futures so a huge directory can't queue unboundedly.
+        for entry in check_files(directory, extension):
+            try:
+                mtime = entry.stat(follow_symlinks=False).st_mtime_ns
+            except OSError as e:
+                logging.warning(f"Skipping {entry.path}: {e}")
+                continue
+            # Check freshness here so unchanged files never reach a worker and a
+            # tick with nothing to do never starts one.
+            out_path = os.path.splitext(entry.path)[0] + target_format
+            if is_up_to_date(entry.path, out_path, mtime):
+                logging.info(f"Skipping {entry.path}, {out_path} is up to date")
+                continue
+            pending.append(executor.submit(convert_file, entry.path, target_format, mtime))
+            if len(pending) > 2 * workers:
+                _log_failure(pending.popleft())
+        for future in pending:
+            _log_failure(future)
+
+class ConversionHandler(FileSystemEventHandler):
+    def __init__(self, executor, extension, target_format):
+        super().__init__()
+        self.executor = executor
+        self.extension = extension
+        self.target_format = target_format
+        # A queued job will still read the latest contents, so repeat events
+        # for it are dropped; events that arrive once it is running mark the
+        # path dirty and it is converted again when the job finishes.
+        self.pending = {}
+        self.dirty = set()
+        self.lock = threading.Lock()
+
+    def submit(self, path):
+        if not path.endswith(self.extension):
+            return
+        path = os.path.abspath(path)
+        with self.lock:
+            future = self.pending.get(path)
+            if future is not None:
+                if future.running():
+                    self.dirty.add(path)
+                return
+            try:
+                future = self.executor.submit(convert_file, path, self.target_format)
+            except RuntimeError:
+                # The pool is shutting down.
+                return
+            self.pending[path] = future
+        future.add_done_callback(lambda done: self.finished(path, done))
+
+    def finished(self, path, future):
+        with self.lock:
+            del self.pending[path]
+            resubmit = path in self.dirty
+            self.dirty.discard(path)
+        _log_failure(future)
+        if resubmit:
+            self.submit(path)
+
+    def on_closed(self, event):
+        if not event.is_directory:
+            self.submit(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.submit(event.dest_path)
+
+    def on_modified(self, event):
+        # Only inotify reports close-after-write; elsewhere fall back to modify events.
+        if _SYSTEM != "Linux" and not event.is_directory:
+            self.submit(event.src_path)
+
+def watch_directory(directory, extension, target_format):
+    workers = min(os.cpu_count() or 1, MAX_WORKERS)
+    with conversion_pool(workers) as executor:
+        handler = ConversionHandler(executor, extension, target_format)
+        observer = Observer()
+        try:
+            observer.schedule(handler, directory, recursive=False)
+            observer.start()
+        except OSError as e:
+            logging.error(f"Cannot watch {directory}: {e}")
+            return
+        logging.info(f"Watching {directory} for {extension} files.")
+        try:
+            # Catch up on anything that changed while nobody was watching.
+            for entry in check_files(directory, extension):
+                handler.submit(entry.path)
+            while observer.is_alive():
+                observer.join(1)
+        except KeyboardInterrupt:
+            logging.info("Stopped watching.")
+        finally:
+            observer.stop()
+            observer.join()
+
 def schedule_task_windows(script_path, directory, extension, target_format, frequency, unit):
     task_name = "FileConversionTask"
-    python_command = f'python {script_path} --dir \\"{directory}\\" --ext \\"{extension}\\" --format \\"{target_format}\\" --scheduled'
-    schedule_unit = {"minute": "MINUTE", "hour": "HOURLY", "day": "DAILY"}
-    schedule_command = (
-        f'schtasks /create /tn "{task_name}" /tr "{python_command}" '
-        f'/sc {schedule_unit[unit]} /mo {frequency} /f'
+    python_command = subprocess.list2cmdline(
+        ["python", script_path, "--dir", directory, "--ext", extension, "--format", target_format, "--scheduled"]
     )
+    schedule_unit = {"minute": "MINUTE", "hour": "HOURLY", "day": "DAILY"}
+    schedule_command = [
+        "schtasks", "/create", "/tn", task_name, "/tr", python_command,
+        "/sc", schedule_unit[unit], "/mo", str(frequency), "/f",
+    ]
     try:
-        subprocess.run(schedule_command, shell=True, check=True)
+        subprocess.run(schedule_command, check=True)
         logging.info(f"Scheduled task '{task_name}' in Windows every {frequency} {unit}(s).")
     except subprocess.CalledProcessError as e:
         logging.error(f"Failed to schedule task in Windows: {e}")
 
 def schedule_task_linux(script_path, directory, extension, target_format, frequency, unit):
     cron_time = f"*/{frequency} * * * *" if unit == "minute" else f"0 */{frequency} * * *" if unit == "hour" else f"0 0 */{frequency} * *"
-    cron_job = f'{cron_time} python3 {script_path} --dir "{directory}" --ext "{extension}" --format "{target_format}" --scheduled'
+    # cron hands the command to /bin/sh and turns unescaped % into newlines.
+    command = shlex.join(
+        ["python3", script_path, "--dir", directory, "--ext", extension, "--format", target_format, "--scheduled"]
+    ).replace("%", "\\%")
+    cron_job = f"{cron_time} {command}"
     try:
-        subprocess.run(f'(crontab -l; echo "{cron_job}") | crontab -', shell=True, executable='/bin/bash')
+        # `crontab -l` exits non-zero when the user has no crontab yet; treat that as empty.
+        current = subprocess.run(["crontab", "-l"], capture_output=True, text=True).stdout
+        if cron_job in current.splitlines():
+            logging.info("Task already scheduled in Linux.")
+            return
+        if current and not current.endswith("\n"):
+            current += "\n"
+        subprocess.run(["crontab", "-"], input=current + cron_job + "\n", text=True, check=True)
         logging.info(f"Scheduled task in Linux every {frequency} {unit}(s).")
     except Exception as e:
         logging.error(f"Failed to schedule task in Linux: {e}")
 
 def main():
     args = parse_arguments()
-    log_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"file_conversion_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
+    log_file = os.path.join(_SCRIPT_DIR, f"file_conversion_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
     setup_logging(log_file)
     logging.info("Script started.")
 
+    if args.watch:
+        watch_directory(args.dir, args.ext, args.format)
+        logging.info("Script finished.")
+        return
+
     if args.scheduled:
-        files = check_files(args.dir, args.ext)
-        for file in files:
-            convert_file(os.path.join(args.dir, file), args.format)
-    else:
-        logging.info("Script ran manually, scheduling task.")
+        # The task is already registered; a tick only converts.
+        convert_files(args.dir, args.ext, args.format)
+        logging.info("Script finished.")
+        return
 
-    script_path = os.path.abspath(__file__)
-    if platform.system() == "Windows":
-        schedule_task_windows(script_path, args.dir, args.ext, args.format, args.frequency, args.unit)
-    elif platform.system() == "Linux":
-        schedule_task_linux(script_path, args.dir, args.ext, args.format, args.frequency, args.unit)
+    logging.info("Script ran manually, scheduling task.")
+    if _SYSTEM == "Windows":
+        schedule_task_windows(_SCRIPT_PATH, args.dir, args.ext, args.format, args.frequency, args.unit)
+    elif _SYSTEM == "Linux":
+        schedule_task_linux(_SCRIPT_PATH, args.dir, args.ext, args.format, args.frequency, args.unit)
     else:
         logging.warning("Unsupported operating system.")
     logging.info("Script finished.")